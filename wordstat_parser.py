@@ -9,12 +9,26 @@ import requests
 import time
 import re
 import os
+import math
+import stat
 import sys
 import shutil
-from urllib.parse import quote, urlencode
+import random
+import gzip
+import json
+import hashlib
+import queue
+import socket
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlencode, urlparse, parse_qs
 from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
@@ -23,22 +37,40 @@ from webdriver_manager.chrome import ChromeDriverManager
 import openpyxl
 from openpyxl.styles import Font
 from openpyxl.utils import get_column_letter
+import numpy as np
+
+
+QUERY_TYPES = ("base", "exact", "precise")
+
+# Первые три буквы названия месяца -> номер месяца
+RUSSIAN_MONTHS = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6,
+    'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12
+}
 
 
 class WordstatParser:
     """Класс для парсинга данных из Яндекс Вордстат"""
     
-    def __init__(self, use_selenium=True):
+    def __init__(self, use_selenium=True, snapshot_dir=None, history_dir=None):
         """
         Инициализация парсера
         
         Args:
             use_selenium (bool): Использовать ли Selenium (рекомендуется для Яндекса)
+            snapshot_dir (str): Папка для сохранения снимков страниц (None - не сохранять)
+            history_dir (str): Папка для помесячной динамики (None - режим без динамики)
         """
         self.use_selenium = use_selenium
         self.base_url = "https://wordstat.yandex.ru/"
         self.driver = None
         self.is_authorized = False  # Флаг авторизации
+        self.snapshot_store = SnapshotStore(snapshot_dir) if snapshot_dir else None
+        self.history_store = HistoryStore(history_dir) if history_dir else None
+        # В режиме динамики открываем график: там и общее число, и помесячная таблица
+        self.view = 'graph' if history_dir else 'table'
+        self.last_page_source = None  # HTML последней загруженной страницы
+        self.request_timeout = 15     # Таймаут загрузки страницы, сек
         
         if use_selenium:
             self._init_selenium()
@@ -271,19 +303,20 @@ class WordstatParser:
         else:
             return query
     
-    def build_wordstat_url(self, query):
+    def build_wordstat_url(self, query, view=None):
         """
         Построение URL для Яндекс Вордстат
         
         Args:
             query (str): Поисковый запрос
+            view (str): Вид страницы ("table" или "graph"), по умолчанию - вид парсера
             
         Returns:
             str: URL для запроса
         """
         params = {
             'region': 'all',
-            'view': 'table',
+            'view': view or self.view,
             'words': query
         }
         return f"{self.base_url}?{urlencode(params)}"
@@ -314,131 +347,10 @@ class WordstatParser:
             else:
                 time.sleep(5)    # Медленно если не авторизован
             
-            # Ищем элементы с частотой запроса в Яндекс Вордстат
-            frequency_selectors = [
-                # Новые селекторы для актуального интерфейса Яндекс Вордстат
-                '.wordstat__content-preview-text_last',
-                '.wordstat__content-preview-text',
-                '.wordstat__number',
-                '.wordstat-number',
-                
-                # Селекторы для общего числа запросов
-                '[class*="wordstat__"]',
-                '[class*="preview-text"]',
-                
-                # Старые селекторы (на всякий случай)
-                '.wordstat-table__row:first-child .wordstat-table__cell:nth-child(2)',
-                '.table__row:first-child .table__cell:nth-child(2)',
-                '[data-testid="frequency"]',
-                '.frequency',
-                '.stat-value'
-            ]
-            
-            frequency = None
-            
-            # Метод 1: Поиск по CSS селекторам
-            for selector in frequency_selectors:
-                try:
-                    elements = self.driver.find_elements(By.CSS_SELECTOR, selector)
-                    for element in elements:
-                        text = element.text.strip()
-                        print(f"    Найден элемент '{selector}': {text}")
-                        
-                        # Ищем числа в формате "за дата – дата: ЧИСЛО"
-                        frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
-                        if frequency_match:
-                            frequency = int(frequency_match.group(1).replace(' ', ''))
-                            print(f"    Извлечена частота из паттерна ': ЧИСЛО': {frequency}")
-                            break
-                        
-                        # Ищем числа в общем тексте
-                        numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})*)\b', text)
-                        if numbers:
-                            frequency = int(numbers[-1].replace(' ', ''))  # Берем последнее число
-                            print(f"    Извлечена частота из чисел: {frequency}")
-                            break
-                    
-                    if frequency:
-                        break
-                except Exception as e:
-                    print(f"    Ошибка с селектором '{selector}': {e}")
-                    continue
-            
-            # Метод 2: Поиск в заголовках и подзаголовках
-            if frequency is None:
-                try:
-                    headings = self.driver.find_elements(By.CSS_SELECTOR, 'h1, h2, h3, .title, [class*="title"]')
-                    for heading in headings:
-                        text = heading.text.strip()
-                        if 'общее число запросов' in text.lower() or 'число запросов' in text.lower():
-                            print(f"    Найден заголовок: {text}")
-                            numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})*)\b', text)
-                            if numbers:
-                                frequency = int(numbers[-1].replace(' ', ''))
-                                print(f"    Извлечена частота из заголовка: {frequency}")
-                                break
-                except Exception as e:
-                    print(f"    Ошибка поиска в заголовках: {e}")
-            
-            # Метод 3: Поиск по XPath (альтернативный)
-            if frequency is None:
-                try:
-                    # Ищем элементы, содержащие текст с числами и датами
-                    xpath_selectors = [
-                        "//div[contains(text(), ':')]",
-                        "//span[contains(text(), ':')]",
-                        "//*[contains(text(), 'число запросов')]",
-                        "//*[contains(text(), '–') and contains(text(), ':')]"
-                    ]
-                    
-                    for xpath in xpath_selectors:
-                        elements = self.driver.find_elements(By.XPATH, xpath)
-                        for element in elements:
-                            text = element.text.strip()
-                            if ':' in text:
-                                print(f"    XPath найден: {text}")
-                                # Ищем число после двоеточия
-                                frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
-                                if frequency_match:
-                                    frequency = int(frequency_match.group(1).replace(' ', ''))
-                                    print(f"    Извлечена частота по XPath: {frequency}")
-                                    break
-                        if frequency:
-                            break
-                except Exception as e:
-                    print(f"    Ошибка XPath поиска: {e}")
+            page_source = self.driver.page_source
+            self.last_page_source = page_source
             
-            # Метод 4: Поиск в исходном коде страницы
-            if frequency is None:
-                try:
-                    page_source = self.driver.page_source
-                    print("    Ищем в исходном коде страницы...")
-                    
-                    # Ищем паттерны с датами и числами
-                    patterns = [
-                        r'за\s+\d{2}\.\d{2}\.\d{4}\s*–\s*\d{2}\.\d{2}\.\d{4}:\s*(\d{1,3}(?:\s\d{3})*)',
-                        r'число запросов[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
-                        r'общее число[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
-                        r':\s*(\d{1,3}(?:\s\d{3})*)</div>'
-                    ]
-                    
-                    for pattern in patterns:
-                        matches = re.findall(pattern, page_source, re.IGNORECASE)
-                        if matches:
-                            frequency = int(matches[-1].replace(' ', ''))
-                            print(f"    Найдена частота в исходном коде: {frequency}")
-                            break
-                    
-                    # Если все еще не найдено, ищем любые большие числа
-                    if frequency is None:
-                        numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})+)\b', page_source)
-                        numbers = [int(n.replace(' ', '')) for n in numbers if int(n.replace(' ', '')) > 100]
-                        if numbers:
-                            frequency = numbers[0]  # Берем первое большое число
-                            print(f"    Найдено большое число как частота: {frequency}")
-                            
-                except Exception as e:
-                    print(f"    Ошибка поиска в исходном коде: {e}")
+            frequency = self.extract_frequency_from_page_source(page_source)
             
             print(f"  Итоговая найденная частота: {frequency}")
             return frequency
@@ -471,90 +383,314 @@ class WordstatParser:
                 'Upgrade-Insecure-Requests': '1',
             }
             
-            response = requests.get(url, headers=headers, timeout=15)
+            response = requests.get(url, headers=headers, timeout=self.request_timeout)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            self.last_page_source = response.text
             
-            # Метод 1: Поиск по CSS классам Яндекс Вордстат
-            frequency_selectors = [
-                '.wordstat__content-preview-text_last',
-                '.wordstat__content-preview-text',
-                '.wordstat__number',
-                'div[class*="wordstat__"]',
-                'span[class*="wordstat"]'
-            ]
+            frequency = self.extract_frequency_from_html(response.text)
+            
+            print(f"  Итоговая найденная частота (requests): {frequency}")
+            return frequency
+            
+        except Exception as e:
+            print(f"  ✗ Ошибка requests для запроса '{query}': {e}")
+            return None
+    
+    @staticmethod
+    def extract_frequency_from_page_source(html, verbose=True):
+        """
+        Извлечение частоты запроса из отрисованной страницы (page_source Selenium)
+        
+        Используется и при парсинге через Selenium, и при офлайн-перепарсинге его снимков.
+        
+        Args:
+            html (str): HTML код отрисованной страницы
+            verbose (bool): Печатать ли найденные элементы
+            
+        Returns:
+            int or None: Частота запроса или None, если не найдена
+        """
+        log = print if verbose else (lambda *args, **kwargs: None)
+        
+        def element_text(text):
+            # Видимый текст элемента с нормализованными пробелами, как element.text в Selenium
+            return " ".join(text.split())
+        
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Ищем элементы с частотой запроса в Яндекс Вордстат
+        frequency_selectors = [
+            # Новые селекторы для актуального интерфейса Яндекс Вордстат
+            '.wordstat__content-preview-text_last',
+            '.wordstat__content-preview-text',
+            '.wordstat__number',
+            '.wordstat-number',
             
-            frequency = None
+            # Селекторы для общего числа запросов
+            '[class*="wordstat__"]',
+            '[class*="preview-text"]',
             
-            for selector in frequency_selectors:
+            # Старые селекторы (на всякий случай)
+            '.wordstat-table__row:first-child .wordstat-table__cell:nth-child(2)',
+            '.table__row:first-child .table__cell:nth-child(2)',
+            '[data-testid="frequency"]',
+            '.frequency',
+            '.stat-value'
+        ]
+        
+        frequency = None
+        
+        # Метод 1: Поиск по CSS селекторам
+        for selector in frequency_selectors:
+            try:
                 elements = soup.select(selector)
                 for element in elements:
-                    text = element.get_text().strip()
-                    if text:
-                        print(f"    Найден элемент '{selector}': {text}")
-                        
-                        # Ищем число после двоеточия (формат "за дата – дата: ЧИСЛО")
-                        frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
-                        if frequency_match:
-                            frequency = int(frequency_match.group(1).replace(' ', ''))
-                            print(f"    Извлечена частота: {frequency}")
-                            break
+                    text = element_text(element.get_text(" "))
+                    log(f"    Найден элемент '{selector}': {text}")
+                    
+                    # Ищем числа в формате "за дата – дата: ЧИСЛО"
+                    frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
+                    if frequency_match:
+                        frequency = int(frequency_match.group(1).replace(' ', ''))
+                        log(f"    Извлечена частота из паттерна ': ЧИСЛО': {frequency}")
+                        break
+                    
+                    # Ищем числа в общем тексте
+                    numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})*)\b', text)
+                    if numbers:
+                        frequency = int(numbers[-1].replace(' ', ''))  # Берем последнее число
+                        log(f"    Извлечена частота из чисел: {frequency}")
+                        break
                 
                 if frequency:
                     break
-            
-            # Метод 2: Поиск в HTML по регулярным выражениям
-            if frequency is None:
-                print("    Ищем в HTML коде...")
-                html_content = response.text
+            except Exception as e:
+                log(f"    Ошибка с селектором '{selector}': {e}")
+                continue
+        
+        # Метод 2: Поиск в заголовках и подзаголовках
+        if frequency is None:
+            try:
+                headings = soup.select('h1, h2, h3, .title, [class*="title"]')
+                for heading in headings:
+                    text = element_text(heading.get_text(" "))
+                    if 'общее число запросов' in text.lower() or 'число запросов' in text.lower():
+                        log(f"    Найден заголовок: {text}")
+                        numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})*)\b', text)
+                        if numbers:
+                            frequency = int(numbers[-1].replace(' ', ''))
+                            log(f"    Извлечена частота из заголовка: {frequency}")
+                            break
+            except Exception as e:
+                log(f"    Ошибка поиска в заголовках: {e}")
+        
+        # Метод 3: Поиск по XPath (альтернативный)
+        if frequency is None:
+            try:
+                tree = lxml_html.fromstring(html)
+                # Ищем элементы, содержащие текст с числами и датами
+                xpath_selectors = [
+                    "//div[contains(text(), ':')]",
+                    "//span[contains(text(), ':')]",
+                    "//*[contains(text(), 'число запросов')]",
+                    "//*[contains(text(), '–') and contains(text(), ':')]"
+                ]
+                
+                for xpath in xpath_selectors:
+                    for element in tree.xpath(xpath):
+                        text = element_text(element.text_content())
+                        if ':' in text:
+                            log(f"    XPath найден: {text}")
+                            # Ищем число после двоеточия
+                            frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
+                            if frequency_match:
+                                frequency = int(frequency_match.group(1).replace(' ', ''))
+                                log(f"    Извлечена частота по XPath: {frequency}")
+                                break
+                    if frequency:
+                        break
+            except Exception as e:
+                log(f"    Ошибка XPath поиска: {e}")
+        
+        # Метод 4: Поиск в исходном коде страницы
+        if frequency is None:
+            try:
+                log("    Ищем в исходном коде страницы...")
                 
+                # Ищем паттерны с датами и числами
                 patterns = [
                     r'за\s+\d{2}\.\d{2}\.\d{4}\s*–\s*\d{2}\.\d{2}\.\d{4}:\s*(\d{1,3}(?:\s\d{3})*)',
                     r'число запросов[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
                     r'общее число[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
-                    r'wordstat__content-preview-text[^>]*>([^<]*:\s*(\d{1,3}(?:\s\d{3})*))',
-                    r'class="[^"]*wordstat[^"]*"[^>]*>([^<]*(\d{1,3}(?:\s\d{3})*))'
+                    r':\s*(\d{1,3}(?:\s\d{3})*)</div>'
                 ]
                 
                 for pattern in patterns:
-                    matches = re.findall(pattern, html_content, re.IGNORECASE)
+                    matches = re.findall(pattern, html, re.IGNORECASE)
                     if matches:
-                        # Извлекаем числа из найденных совпадений
-                        for match in matches:
-                            if isinstance(match, tuple):
-                                # Берем последний элемент кортежа (обычно число)
-                                number_str = match[-1]
-                            else:
-                                number_str = match
-                            
-                            if re.match(r'\d{1,3}(?:\s\d{3})*', number_str):
-                                frequency = int(number_str.replace(' ', ''))
-                                print(f"    Найдена частота в HTML: {frequency}")
-                                break
-                        if frequency:
-                            break
-            
-            # Метод 3: Поиск любых больших чисел (последний вариант)
-            if frequency is None:
-                print("    Ищем любые большие числа...")
-                # Ищем все числа в HTML
-                all_numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})+)\b', response.text)
-                if all_numbers:
-                    # Конвертируем в int и фильтруем большие числа
-                    numbers = [int(n.replace(' ', '')) for n in all_numbers]
-                    numbers = [n for n in numbers if n > 1000]  # Исключаем маленькие числа
-                    
+                        frequency = int(matches[-1].replace(' ', ''))
+                        log(f"    Найдена частота в исходном коде: {frequency}")
+                        break
+                
+                # Если все еще не найдено, ищем любые большие числа
+                if frequency is None:
+                    numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})+)\b', html)
+                    numbers = [int(n.replace(' ', '')) for n in numbers if int(n.replace(' ', '')) > 100]
                     if numbers:
                         frequency = numbers[0]  # Берем первое большое число
-                        print(f"    Найдено большое число: {frequency}")
+                        log(f"    Найдено большое число как частота: {frequency}")
+                        
+            except Exception as e:
+                log(f"    Ошибка поиска в исходном коде: {e}")
+        
+        return frequency
+    
+    @staticmethod
+    def extract_frequency_from_html(html, verbose=True):
+        """
+        Извлечение частоты запроса из HTML страницы Вордстата
+        
+        Используется и при парсинге через requests, и при офлайн-перепарсинге снимков.
+        
+        Args:
+            html (str): HTML код страницы
+            verbose (bool): Печатать ли найденные элементы
             
-            print(f"  Итоговая найденная частота (requests): {frequency}")
-            return frequency
+        Returns:
+            int or None: Частота запроса или None, если не найдена
+        """
+        log = print if verbose else (lambda *args, **kwargs: None)
+        
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Метод 1: Поиск по CSS классам Яндекс Вордстат
+        frequency_selectors = [
+            '.wordstat__content-preview-text_last',
+            '.wordstat__content-preview-text',
+            '.wordstat__number',
+            'div[class*="wordstat__"]',
+            'span[class*="wordstat"]'
+        ]
+        
+        frequency = None
+        
+        for selector in frequency_selectors:
+            elements = soup.select(selector)
+            for element in elements:
+                text = element.get_text().strip()
+                if text:
+                    log(f"    Найден элемент '{selector}': {text}")
+                    
+                    # Ищем число после двоеточия (формат "за дата – дата: ЧИСЛО")
+                    frequency_match = re.search(r':\s*(\d{1,3}(?:\s\d{3})*)', text)
+                    if frequency_match:
+                        frequency = int(frequency_match.group(1).replace(' ', ''))
+                        log(f"    Извлечена частота: {frequency}")
+                        break
             
-        except Exception as e:
-            print(f"  ✗ Ошибка requests для запроса '{query}': {e}")
+            if frequency:
+                break
+        
+        # Метод 2: Поиск в HTML по регулярным выражениям
+        if frequency is None:
+            log("    Ищем в HTML коде...")
+            
+            patterns = [
+                r'за\s+\d{2}\.\d{2}\.\d{4}\s*–\s*\d{2}\.\d{2}\.\d{4}:\s*(\d{1,3}(?:\s\d{3})*)',
+                r'число запросов[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
+                r'общее число[^:]+:\s*(\d{1,3}(?:\s\d{3})*)',
+                r'wordstat__content-preview-text[^>]*>([^<]*:\s*(\d{1,3}(?:\s\d{3})*))',
+                r'class="[^"]*wordstat[^"]*"[^>]*>([^<]*(\d{1,3}(?:\s\d{3})*))'
+            ]
+            
+            for pattern in patterns:
+                matches = re.findall(pattern, html, re.IGNORECASE)
+                if matches:
+                    # Извлекаем числа из найденных совпадений
+                    for match in matches:
+                        if isinstance(match, tuple):
+                            # Берем последний элемент кортежа (обычно число)
+                            number_str = match[-1]
+                        else:
+                            number_str = match
+                        
+                        if re.match(r'\d{1,3}(?:\s\d{3})*', number_str):
+                            frequency = int(number_str.replace(' ', ''))
+                            log(f"    Найдена частота в HTML: {frequency}")
+                            break
+                    if frequency:
+                        break
+        
+        # Метод 3: Поиск любых больших чисел (последний вариант)
+        if frequency is None:
+            log("    Ищем любые большие числа...")
+            # Ищем все числа в HTML
+            all_numbers = re.findall(r'\b(\d{1,3}(?:\s\d{3})+)\b', html)
+            if all_numbers:
+                # Конвертируем в int и фильтруем большие числа
+                numbers = [int(n.replace(' ', '')) for n in all_numbers]
+                numbers = [n for n in numbers if n > 1000]  # Исключаем маленькие числа
+                
+                if numbers:
+                    frequency = numbers[0]  # Берем первое большое число
+                    log(f"    Найдено большое число: {frequency}")
+        
+        return frequency
+    
+    @staticmethod
+    def extract_monthly_history_from_html(html):
+        """
+        Извлечение помесячной динамики из HTML страницы Вордстата (вид "graph")
+        
+        Args:
+            html (str): HTML код страницы
+            
+        Returns:
+            list: Список (месяц в формате ГГГГММ, число запросов), отсортированный по месяцу
+        """
+        date_pattern = re.compile(r'(\d{2})\.(\d{2})\.(\d{4})')
+        name_pattern = re.compile(r'([а-яё]+)\s+(\d{4})', re.IGNORECASE)
+        number_pattern = re.compile(r'^\d{1,3}(?:\s\d{3})*$')
+        
+        def parse_month(text):
+            # Формат "01.09.2024 – 30.09.2024": берем первую дату
+            date_match = date_pattern.search(text)
+            if date_match:
+                return int(date_match.group(3)) * 100 + int(date_match.group(2))
+            # Формат "сентябрь 2024"
+            name_match = name_pattern.search(text)
+            if name_match:
+                month = RUSSIAN_MONTHS.get(name_match.group(1).lower()[:3])
+                if month:
+                    return int(name_match.group(2)) * 100 + month
             return None
+        
+        series = {}
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Метод 1: Строки таблицы динамики "Период | Число запросов | Доля"
+        for row in soup.select('tr'):
+            cells = [cell.get_text(" ", strip=True) for cell in row.select('td, th')]
+            if len(cells) < 2:
+                continue
+            month = parse_month(cells[0])
+            if month is None:
+                continue
+            for cell in cells[1:]:
+                if number_pattern.match(cell):
+                    series[month] = int(re.sub(r'\s', '', cell))
+                    break
+        
+        # Метод 2: Периоды с числами в тексте страницы
+        if not series:
+            text = soup.get_text(" ")
+            for match in re.finditer(
+                r'(\d{2}\.\d{2}\.\d{4})\s*[–-]\s*\d{2}\.\d{2}\.\d{4}\s+(\d{1,3}(?:\s\d{3})*)(?!\d)', text
+            ):
+                series[parse_month(match.group(1))] = int(re.sub(r'\s', '', match.group(2)))
+        
+        return sorted(series.items())
     
     def get_query_frequency(self, query, query_type="base"):
         """
@@ -568,11 +704,49 @@ class WordstatParser:
             int or None: Частота запроса
         """
         formatted_query = self.format_query(query, query_type)
+        self.last_page_source = None
         
         if self.use_selenium:
-            return self.parse_frequency_selenium(formatted_query)
+            frequency = self.parse_frequency_selenium(formatted_query)
         else:
-            return self.parse_frequency_requests(formatted_query)
+            frequency = self.parse_frequency_requests(formatted_query)
+        
+        if self.snapshot_store and self.last_page_source:
+            source = "selenium" if self.use_selenium else "requests"
+            self.snapshot_store.save(self.last_page_source, query.strip(), query_type, source)
+        
+        if self.history_store and self.last_page_source:
+            series = self.extract_monthly_history_from_html(self.last_page_source)
+            if series:
+                self.history_store.append(query.strip(), query_type, series)
+            print(f"  📈 Помесячная динамика: {len(series)} мес.")
+        
+        return frequency
+    
+    def set_request_timeout(self, seconds):
+        """
+        Установка таймаута загрузки страницы
+        
+        Args:
+            seconds (float): Таймаут в секундах (для requests и для загрузки страницы в Selenium)
+        """
+        self.request_timeout = seconds
+        if self.driver:
+            try:
+                self.driver.set_page_load_timeout(seconds)
+            except Exception as e:
+                print(f"  ✗ Не удалось установить таймаут загрузки: {e}")
+    
+    def get_request_delay(self):
+        """
+        Задержка между запросами в зависимости от авторизации
+        
+        Returns:
+            float: Задержка в секундах
+        """
+        if self.is_authorized:
+            return 0.5  # Быстро если авторизован
+        return 2.0      # Медленно если не авторизован
     
     def read_queries_from_file(self, filename):
         """
@@ -649,17 +823,20 @@ class WordstatParser:
         except Exception as e:
             print(f"✗ Ошибка создания Excel файла: {e}")
     
-    def process_queries(self, queries):
+    def process_queries(self, queries, fetcher=None, inference=None):
         """
         Обработка списка запросов
         
         Args:
             queries (list): Список запросов для обработки
+            fetcher (HedgedFetcher): Слой повторов и хеджирования (None - загружать напрямую)
+            inference (FrequencyInference): Вывод частот без загрузки (None - загружать все)
             
         Returns:
             list: Результаты парсинга
         """
-        results = []
+        get_frequency = fetcher.get_query_frequency if fetcher else self.get_query_frequency
+        results = [None] * len(queries)
         total_queries = len(queries)
         
         print(f"\n🚀 Начинаю обработку {total_queries} запросов...")
@@ -674,37 +851,58 @@ class WordstatParser:
                 print("⚠️  Продолжаем без авторизации (с медленными запросами)")
         
         # Определяем задержку между запросами
+        delay = self.get_request_delay()
         if self.is_authorized:
-            delay = 0.5  # Быстро если авторизован
             print(f"✅ Авторизован! Используем задержку {delay} сек между запросами")
         else:
-            delay = 2.0  # Медленно если не авторизован
             print(f"⚠️  Не авторизован. Используем задержку {delay} сек между запросами")
         
-        for idx, query in enumerate(queries, 1):
+        def fetch(query, query_type):
+            if inference:
+                frequency = inference.infer(query, query_type)
+                if frequency is not None:
+                    print(f"  💡 Определено без загрузки: {frequency}")
+                    return frequency
+            
+            frequency = get_frequency(query, query_type)
+            if inference:
+                inference.record(query, query_type, frequency)
+            time.sleep(delay)  # Задержка между запросами
+            return frequency
+        
+        # Короткие запросы первыми: их нулевые частоты закрывают более длинные запросы
+        order = list(range(total_queries))
+        if inference:
+            order.sort(key=lambda i: len(queries[i].split()))
+        
+        for idx, query_idx in enumerate(order, 1):
+            query = queries[query_idx]
             print(f"\n[{idx}/{total_queries}] Обрабатываю: '{query}'")
             
             result = {'query': query}
             
             # Парсим базовую частоту
             print("  📊 Базовая частота...")
-            result['base_frequency'] = self.get_query_frequency(query, "base")
-            time.sleep(delay)  # Задержка между запросами
+            result['base_frequency'] = fetch(query, "base")
             
             # Парсим точную частоту
             print("  🎯 Точная частота...")
-            result['exact_frequency'] = self.get_query_frequency(query, "exact")
-            time.sleep(delay)
+            result['exact_frequency'] = fetch(query, "exact")
             
             # Парсим уточненную частоту
             print("  🔍 Уточненная частота...")
-            result['precise_frequency'] = self.get_query_frequency(query, "precise")
-            time.sleep(delay)
+            result['precise_frequency'] = fetch(query, "precise")
             
-            results.append(result)
+            results[query_idx] = result
             
             print(f"  ✓ Результат: {result['base_frequency']} | {result['exact_frequency']} | {result['precise_frequency']}")
         
+        if fetcher:
+            print()
+            fetcher.print_stats()
+        if inference:
+            print(f"💡 Определено без загрузки: {inference.avoided} из {inference.lookups} частот")
+        
         return results
     
     def close(self):
@@ -714,32 +912,1194 @@ class WordstatParser:
             print("✓ WebDriver закрыт")
 
 
-def main():
-    """Основная функция программы"""
-    print("=== Парсер Яндекс Вордстат ===\n")
+class SnapshotStore:
+    """
+    Хранилище снимков загруженных страниц
     
-    # Проверяем наличие файла с запросами
-    input_file = "queries.txt"
-    if not os.path.exists(input_file):
-        print(f"✗ Файл {input_file} не найден!")
-        print(f"Создайте файл {input_file} и добавьте в него запросы (по одному на строку)")
-        return
+    Страницы хранятся сжатыми (gzip) и адресуются по SHA-256 содержимого,
+    поэтому одинаковые страницы занимают место один раз. Журнал index.jsonl
+    связывает запрос и тип запроса с хэшем снимка.
+    """
     
-    # Создаем экземпляр парсера
-    parser = WordstatParser(use_selenium=True)
+    _lock = threading.Lock()
     
-    try:
-        # Читаем запросы из файла
-        queries = parser.read_queries_from_file(input_file)
-        if not queries:
-            print("✗ Не удалось прочитать запросы из файла")
+    def __init__(self, directory="snapshots"):
+        """
+        Инициализация хранилища
+        
+        Args:
+            directory (str): Папка хранилища
+        """
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.jsonl")
+    
+    def path_for(self, digest):
+        """
+        Путь к файлу снимка по его хэшу
+        
+        Args:
+            digest (str): SHA-256 содержимого страницы
+            
+        Returns:
+            str: Путь к файлу снимка
+        """
+        return os.path.join(self.directory, digest[:2], f"{digest}.html.gz")
+    
+    def save(self, html, query, query_type, source):
+        """
+        Сохранение снимка страницы
+        
+        Args:
+            html (str): HTML код страницы
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            source (str): Способ загрузки ("selenium" или "requests")
+            
+        Returns:
+            str or None: Хэш снимка или None в случае ошибки
+        """
+        try:
+            data = html.encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()
+            path = self.path_for(digest)
+            
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp_path, 'wb') as file:
+                    file.write(data)
+                os.replace(tmp_path, path)
+            
+            entry = {
+                'query': query,
+                'type': query_type,
+                'hash': digest,
+                'source': source,
+                'time': time.time()
+            }
+            with self._lock:
+                with open(self.index_path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            
+            return digest
+        except Exception as e:
+            print(f"    ✗ Ошибка сохранения снимка: {e}")
+            return None
+    
+    def load(self, digest):
+        """
+        Чтение снимка страницы
+        
+        Args:
+            digest (str): Хэш снимка
+            
+        Returns:
+            str: HTML код страницы
+        """
+        with gzip.open(self.path_for(digest), 'rt', encoding='utf-8') as file:
+            return file.read()
+    
+    def read_index(self):
+        """
+        Чтение журнала снимков
+        
+        Returns:
+            list: Записи журнала; для каждой пары (запрос, тип) остается самый свежий снимок
+        """
+        latest = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    key = (entry['query'], entry['type'])
+                    # Порядок первого появления сохраняется, значение обновляется
+                    latest[key] = entry
+        except FileNotFoundError:
+            pass
+        return list(latest.values())
+
+
+class HistoryStore:
+    """
+    Компактное хранилище помесячной динамики
+    
+    Каждая строка history.bin - запись фиксированной ширины HISTORY_DTYPE
+    (запрос, тип, месяц, число запросов), файл читается через np.memmap.
+    Тексты запросов хранятся в queries.txt: номер строки - идентификатор запроса.
+    Перед каждым обращением новые строки queries.txt дочитываются, поэтому
+    несколько экземпляров на одной папке выдают одинаковые идентификаторы.
+    """
+    
+    HISTORY_DTYPE = np.dtype([
+        ('query_id', '<u4'),
+        ('query_type', 'u1'),
+        ('month', '<u4'),    # ГГГГММ
+        ('count', '<u8')
+    ])
+    
+    _lock = threading.Lock()
+    
+    def __init__(self, directory="history"):
+        """
+        Инициализация хранилища
+        
+        Args:
+            directory (str): Папка хранилища
+        """
+        self.directory = directory
+        self.data_path = os.path.join(directory, "history.bin")
+        self.queries_path = os.path.join(directory, "queries.txt")
+        os.makedirs(directory, exist_ok=True)
+        
+        self.queries = []
+        self.query_ids = {}
+        self._queries_offset = 0  # сколько байт queries.txt уже прочитано
+        with self._lock:
+            self._sync_queries()
+    
+    def _sync_queries(self):
+        """Дочитывание запросов, добавленных в queries.txt (вызывается под _lock)"""
+        if not os.path.exists(self.queries_path):
             return
+        with open(self.queries_path, 'rb') as file:
+            file.seek(self._queries_offset)
+            data = file.read()
+        # Берем только целиком записанные строки
+        data = data[:data.rfind(b"\n") + 1]
+        self._queries_offset += len(data)
+        for line in data.decode('utf-8').splitlines():
+            self.query_ids.setdefault(line, len(self.queries))
+            self.queries.append(line)
+    
+    def append(self, query, query_type, series):
+        """
+        Добавление помесячной динамики запроса
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            series (list): Список (месяц ГГГГММ, число запросов)
+        """
+        with self._lock:
+            # Идентификатор - номер строки в общем queries.txt, а не в памяти экземпляра
+            self._sync_queries()
+            query_id = self.query_ids.get(query)
+            if query_id is None:
+                with open(self.queries_path, 'a', encoding='utf-8') as file:
+                    file.write(query + "\n")
+                self._sync_queries()
+                query_id = self.query_ids[query]
+            
+            records = np.zeros(len(series), dtype=self.HISTORY_DTYPE)
+            records['query_id'] = query_id
+            records['query_type'] = QUERY_TYPES.index(query_type)
+            records['month'] = [month for month, _ in series]
+            records['count'] = [count for _, count in series]
+            
+            with open(self.data_path, 'ab') as file:
+                # Отрезаем недописанную запись после сбоя, иначе новые записи сместятся
+                torn = file.tell() % self.HISTORY_DTYPE.itemsize
+                if torn:
+                    file.truncate(file.tell() - torn)
+                file.write(records.tobytes())
+    
+    def load(self):
+        """
+        Отображение файла динамики в память
+        
+        Returns:
+            np.ndarray: Записи HISTORY_DTYPE (np.memmap, только чтение)
+        """
+        # Размер читаем под блокировкой: другие потоки дописывают записи целиком под ней же.
+        # Недописанный хвост (например, после сбоя во время append) не отображается
+        with self._lock:
+            size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        count = size // self.HISTORY_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=self.HISTORY_DTYPE)
+        return np.memmap(self.data_path, dtype=self.HISTORY_DTYPE, mode='r', shape=(count,))
+    
+    def latest(self, query_type="base"):
+        """
+        Записи одного типа без повторов: при повторной загрузке запроса берется последняя
+        
+        Args:
+            query_type (str): Тип запроса
+            
+        Returns:
+            np.ndarray: Записи HISTORY_DTYPE, отсортированные по запросу и месяцу
+        """
+        records = self.load()
+        records = records[records['query_type'] == QUERY_TYPES.index(query_type)]
+        if len(records) == 0:
+            return np.asarray(records)
+        
+        # Ключ (запрос, месяц) в одном uint64; устойчивая сортировка сохраняет порядок записи,
+        # поэтому последняя запись в каждой группе - самая свежая
+        months = records['month'] // 100 * 12 + records['month'] % 100
+        keys = (records['query_id'].astype(np.uint64) << np.uint64(20)) | months.astype(np.uint64)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        return records[order[last]]
+    
+    def series(self, query, query_type="base"):
+        """
+        Помесячная динамика одного запроса
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            
+        Returns:
+            list: Список (месяц ГГГГММ, число запросов)
+        """
+        with self._lock:
+            self._sync_queries()
+        query_id = self.query_ids.get(query.strip())
+        if query_id is None:
+            return []
+        records = self.latest(query_type)
+        records = records[records['query_id'] == query_id]
+        return list(zip(records['month'].tolist(), records['count'].tolist()))
+    
+    def aggregate_by_month(self, query_type="base", queries=None):
+        """
+        Суммарное число запросов по месяцам
+        
+        Args:
+            query_type (str): Тип запроса
+            queries (list): Ограничить суммирование этими запросами (None - все)
+            
+        Returns:
+            tuple: (массив месяцев ГГГГММ, массив сумм)
+        """
+        records = self.latest(query_type)
+        if queries is not None:
+            with self._lock:
+                self._sync_queries()
+            ids = [self.query_ids[q] for q in queries if q in self.query_ids]
+            records = records[np.isin(records['query_id'], ids)]
+        
+        months, inverse = np.unique(records['month'], return_inverse=True)
+        totals = np.bincount(inverse, weights=records['count'], minlength=len(months))
+        return months, totals.astype(np.uint64)
+
+
+def _reextract_snapshot(task):
+    """Извлечение частоты из одного снимка (выполняется в процессе пула)"""
+    path, source = task
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            html = file.read()
+        # Снимок разбирается тем же извлекателем, что и при живой загрузке
+        if source == "selenium":
+            return WordstatParser.extract_frequency_from_page_source(html, verbose=False)
+        return WordstatParser.extract_frequency_from_html(html, verbose=False)
+    except Exception:
+        return None
+
+
+def reextract_snapshots(snapshot_dir="snapshots", workers=None):
+    """
+    Офлайн-перепарсинг сохраненных снимков без сети и браузера
+    
+    Args:
+        snapshot_dir (str): Папка хранилища снимков
+        workers (int): Количество процессов (по умолчанию - все ядра)
+        
+    Returns:
+        list: Результаты в формате process_queries
+    """
+    store = SnapshotStore(snapshot_dir)
+    entries = store.read_index()
+    if not entries:
+        print(f"✗ В {snapshot_dir} нет снимков")
+        return []
+    
+    snapshots = sorted({(entry['hash'], entry.get('source', 'requests')) for entry in entries})
+    tasks = [(store.path_for(digest), source) for digest, source in snapshots]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    
+    print(f"🔁 Перепарсинг {len(tasks)} снимков в {workers} процессах...")
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        frequencies = dict(zip(snapshots, executor.map(_reextract_snapshot, tasks, chunksize=chunksize)))
+    print(f"✓ Перепарсинг завершен за {time.time() - started:.1f} сек")
+    
+    results = {}
+    for entry in entries:
+        result = results.setdefault(entry['query'], {'query': entry['query']})
+        snapshot = (entry['hash'], entry.get('source', 'requests'))
+        result[f"{entry['type']}_frequency"] = frequencies[snapshot]
+    
+    return list(results.values())
+
+
+class FrequencyInference:
+    """
+    Вывод частот без загрузки страницы
+    
+    Использует ограничения Вордстата:
+    - для одного запроса уточненная <= точная <= базовая, поэтому нулевая базовая
+      (или точная) частота означает нули для более узких типов;
+    - в базовом соответствии запрос, содержащий все слова запроса с нулевой
+      частотой, тоже имеет нулевую частоту.
+    Наборы слов нулевых запросов хранятся в инвертированном индексе слово -> наборы,
+    что позволяет быстро найти нулевой поднабор слов нового запроса.
+    """
+    
+    # Операторы Вордстата меняют смысл слова - такие запросы не участвуют в выводе по словам
+    OPERATOR_CHARS = set('!+-"[]()|')
+    
+    def __init__(self):
+        self.known = {}        # (нормализованный запрос, тип) -> частота
+        self.zero_sets = []    # наборы слов запросов с нулевой базовой частотой
+        self.zero_index = {}   # слово -> номера наборов в zero_sets, содержащих это слово
+        self.lookups = 0
+        self.avoided = 0
+    
+    @classmethod
+    def tokenize(cls, query):
+        """
+        Набор слов запроса
+        
+        Args:
+            query (str): Исходный запрос
+            
+        Returns:
+            frozenset or None: Набор слов в нижнем регистре или None, если в запросе есть операторы
+        """
+        words = query.lower().split()
+        if not words or any(cls.OPERATOR_CHARS & set(word) for word in words):
+            return None
+        return frozenset(words)
+    
+    def has_zero_subset(self, tokens):
+        """
+        Проверка, содержит ли набор слов целиком какой-либо нулевой набор
+        
+        Args:
+            tokens (frozenset): Набор слов запроса
+            
+        Returns:
+            bool: True если найден нулевой поднабор
+        """
+        matched = {}
+        for token in tokens:
+            for set_id in self.zero_index.get(token, ()):
+                matched[set_id] = matched.get(set_id, 0) + 1
+                if matched[set_id] == len(self.zero_sets[set_id]):
+                    return True
+        return False
+    
+    def infer(self, query, query_type="base"):
+        """
+        Попытка определить частоту без загрузки
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            
+        Returns:
+            int or None: Частота, если она однозначно следует из известных результатов
+        """
+        self.lookups += 1
+        key = " ".join(query.lower().split())
+        
+        frequency = self.known.get((key, query_type))
+        if frequency is None:
+            # Более широкий тип того же запроса с нулевой частотой
+            wider_types = QUERY_TYPES[:QUERY_TYPES.index(query_type)]
+            if any(self.known.get((key, wider)) == 0 for wider in wider_types):
+                frequency = 0
+        
+        if frequency is None:
+            tokens = self.tokenize(query)
+            if tokens and self.has_zero_subset(tokens):
+                frequency = 0
+        
+        if frequency is not None:
+            self.avoided += 1
+        return frequency
+    
+    def record(self, query, query_type, frequency):
+        """
+        Запоминание загруженного результата
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            frequency (int or None): Частота запроса
+        """
+        if frequency is None:
+            return
+        
+        key = " ".join(query.lower().split())
+        self.known[(key, query_type)] = frequency
+        
+        if query_type == "base" and frequency == 0:
+            tokens = self.tokenize(query)
+            # Наборы, уже покрытые нулевым поднабором, ничего нового не дают
+            if tokens and not self.has_zero_subset(tokens):
+                set_id = len(self.zero_sets)
+                self.zero_sets.append(tokens)
+                for token in tokens:
+                    self.zero_index.setdefault(token, []).append(set_id)
+
+
+class HedgedFetcher:
+    """
+    Слой повторов и хеджирования вокруг get_query_frequency
+    
+    Каждая попытка ограничена дедлайном. Если попытка идет дольше наблюдаемого
+    p95 времени загрузки, тот же запрос отправляется свободному парсеру (другой
+    браузер или сессия requests) - побеждает тот, кто ответит первым. Попытки,
+    завершившиеся таймаутом или ошибкой загрузки, повторяются с экспоненциальной
+    задержкой со случайным разбросом. Если страница загрузилась, но частота на ней
+    не найдена, повтор ничего не изменит, и он не выполняется.
+    """
+    
+    def __init__(self, parsers, attempt_timeout=20, max_retries=2, backoff_base=1.0,
+                 backoff_max=30, hedge_quantile=0.95, initial_hedge_delay=5.0, min_samples=20,
+                 page_load_margin=6.0):
+        """
+        Инициализация слоя
+        
+        Args:
+            parsers (list): Парсеры (WordstatParser), между которыми распределяются попытки
+            attempt_timeout (float): Дедлайн одной попытки, сек
+            max_retries (int): Количество повторов после первой неудачной попытки
+            backoff_base (float): Базовая задержка перед повтором, сек
+            backoff_max (float): Максимальная задержка перед повтором, сек
+            hedge_quantile (float): Квантиль времени загрузки, после которого отправляется хедж
+            initial_hedge_delay (float): Порог хеджа, пока замеров мало, сек
+            min_samples (int): Минимум замеров для расчета квантиля
+            page_load_margin (float): Запас дедлайна после загрузки страницы (ожидание и разбор), сек
+        """
+        self.parsers = list(parsers)
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_samples = min_samples
+        
+        # Загрузка страницы должна закончиться раньше дедлайна: после нее еще ожидание и разбор
+        page_load_timeout = max(attempt_timeout / 2, attempt_timeout - page_load_margin)
+        
+        self.idle = queue.Queue()
+        for parser in self.parsers:
+            parser.set_request_timeout(page_load_timeout)
+            self.idle.put(parser)
+        
+        self.executor = ThreadPoolExecutor(max_workers=len(self.parsers), thread_name_prefix="wordstat-attempt")
+        self.latencies = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'attempts': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'late_wins': 0,
+            'retries': 0,
+            'timeouts': 0,
+            'not_found': 0,
+            'failures': 0
+        }
+    
+    def hedge_delay(self):
+        """
+        Порог запуска хеджа
+        
+        Returns:
+            float: Наблюдаемый квантиль времени загрузки (не больше дедлайна попытки), сек
+        """
+        with self.lock:
+            samples = sorted(self.latencies)
+        if len(samples) < self.min_samples:
+            return min(self.initial_hedge_delay, self.attempt_timeout)
+        index = int(self.hedge_quantile * (len(samples) - 1))
+        return min(samples[index], self.attempt_timeout)
+    
+    def get_query_frequency(self, query, query_type="base"):
+        """
+        Получение частоты запроса с дедлайнами, хеджированием и повторами
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            
+        Returns:
+            int or None: Частота запроса или None, если все попытки неудачны
+        """
+        self._count('calls')
+        late = set()  # попытки, брошенные по дедлайну, но еще выполняющиеся
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                backoff *= 0.5 + random.random()
+                self._count('retries')
+                print(f"  🔁 Повтор {attempt}/{self.max_retries} через {backoff:.1f} сек...")
+                
+                # Пока ждем повтора, брошенная попытка может успеть ответить
+                started = time.time()
+                frequency = self._collect_late(late, backoff)
+                if frequency is not None:
+                    return frequency
+                time.sleep(max(0, backoff - (time.time() - started)))
+                
+                # Все парсеры заняты брошенными попытками - ждем их, а не ставим новую загрузку в очередь
+                if late and self.idle.empty():
+                    frequency = self._collect_late(late, self.attempt_timeout)
+                    if frequency is not None:
+                        return frequency
+            
+            frequency, retryable = self._hedged_attempt(query, query_type, late)
+            if frequency is not None:
+                return frequency
+            if not retryable:
+                print("  ∅ Страница загружена, но частота не найдена - повтор не нужен")
+                self._count('not_found')
+                return None
+        
+        self._count('failures')
+        return None
+    
+    def _collect_late(self, late, timeout):
+        """
+        Ожидание брошенных попыток
+        
+        Args:
+            late (set): Future брошенных попыток (завершенные удаляются)
+            timeout (float): Максимальное время ожидания, сек
+            
+        Returns:
+            int or None: Частота, если брошенная попытка все же ее получила
+        """
+        end = time.time() + timeout
+        while late:
+            remaining = end - time.time()
+            if remaining <= 0:
+                break
+            done, _ = wait(late, timeout=remaining, return_when=FIRST_COMPLETED)
+            late.difference_update(done)
+            for future in done:
+                frequency, _ = future.result()
+                if frequency is not None:
+                    print("  ⏱️  Брошенная по дедлайну попытка вернула частоту")
+                    self._count('late_wins')
+                    return frequency
+        return None
+    
+    def _hedged_attempt(self, query, query_type, late):
+        """
+        Одна попытка с дедлайном и возможным хеджем; незавершенные попытки попадают в late
+        
+        Returns:
+            tuple: (частота или None, имеет ли смысл повтор)
+        """
+        primary = self._launch(query, query_type, timeout=self.attempt_timeout)
+        if primary is None:
+            self._count('timeouts')
+            return None, True
+        
+        started = time.time()
+        deadline = started + self.attempt_timeout
+        hedge_at = started + self.hedge_delay()
+        pending = {primary}
+        hedged = len(self.parsers) < 2
+        
+        while pending:
+            now = time.time()
+            if now >= deadline:
+                print(f"  ⏱️  Попытка превысила дедлайн {self.attempt_timeout} сек")
+                self._count('timeouts')
+                late.update(pending)
+                return None, True
+            
+            wait_until = deadline if hedged else min(hedge_at, deadline)
+            done, pending = wait(pending, timeout=max(0, wait_until - now), return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                frequency, page_loaded = future.result()
+                if frequency is not None:
+                    if future is not primary:
+                        self._count('hedge_wins')
+                    return frequency, False
+                if page_loaded:
+                    # Страница получена, но числа на ней нет - повтор даст то же самое
+                    late.update(pending)
+                    return None, False
+            
+            if not hedged and pending and time.time() >= hedge_at:
+                hedged = True
+                hedge = self._launch(query, query_type)
+                if hedge is not None:
+                    print(f"  🪃 Загрузка дольше {hedge_at - started:.1f} сек, отправляем хедж")
+                    self._count('hedges')
+                    pending.add(hedge)
+        
+        return None, True
+    
+    def _launch(self, query, query_type, timeout=None):
+        """
+        Запуск попытки на свободном парсере
+        
+        Args:
+            timeout (float): Сколько ждать свободный парсер (None - не ждать)
+            
+        Returns:
+            Future or None: Future с (частота, загружена ли страница) или None, если свободного парсера нет
+        """
+        try:
+            if timeout is None:
+                parser = self.idle.get_nowait()
+            else:
+                parser = self.idle.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        
+        self._count('attempts')
+        return self.executor.submit(self._run, parser, query, query_type)
+    
+    def _run(self, parser, query, query_type):
+        """
+        Выполнение попытки; парсер возвращается в пул после завершения
+        
+        Returns:
+            tuple: (частота или None, загружена ли страница)
+        """
+        started = time.time()
+        try:
+            frequency = parser.get_query_frequency(query, query_type)
+            # last_page_source сбрасывается в начале загрузки и заполняется после ее успеха
+            return frequency, parser.last_page_source is not None
+        except Exception as e:
+            print(f"  ✗ Ошибка попытки для запроса '{query}': {e}")
+            return None, False
+        finally:
+            with self.lock:
+                self.latencies.append(time.time() - started)
+            self.idle.put(parser)
+    
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+    
+    def print_stats(self):
+        """Вывод статистики повторов и хеджирования"""
+        with self.lock:
+            stats = dict(self.stats)
+        print(f"📈 Попыток: {stats['attempts']}, хеджей: {stats['hedges']} (выиграли: {stats['hedge_wins']}), "
+              f"повторов: {stats['retries']}, таймаутов: {stats['timeouts']} "
+              f"(ответили после дедлайна: {stats['late_wins']}), "
+              f"частота не найдена на странице: {stats['not_found']}, "
+              f"без результата после повторов: {stats['failures']} из {stats['calls']}")
+    
+    def close(self):
+        """Ожидание незавершенных попыток"""
+        self.executor.shutdown(wait=True)
+
+
+class FrequencyService:
+    """
+    Долгоживущий сервис частот запросов
+    
+    Держит прогретые экземпляры WordstatParser (браузер запущен, авторизация пройдена),
+    отвечает из кэша, объединяет одновременные одинаковые запросы в одну загрузку
+    и раздает ожидающие запросы воркерам микро-батчами.
+    """
+    
+    def __init__(self, workers=1, use_selenium=True, cache_ttl=24 * 60 * 60, cache_size=100000,
+                 batch_size=10, batch_wait=0.05, snapshot_dir=None, history_dir=None):
+        """
+        Инициализация сервиса
+        
+        Args:
+            workers (int): Количество воркеров (по одному парсеру на воркер)
+            use_selenium (bool): Использовать ли Selenium в парсерах
+            cache_ttl (float): Время жизни записи в кэше, сек
+            cache_size (int): Максимум записей в кэше (давно не запрашиваемые вытесняются)
+            batch_size (int): Максимальный размер микро-батча
+            batch_wait (float): Сколько ждать добора батча после первого запроса, сек
+            snapshot_dir (str): Папка для сохранения снимков страниц (None - не сохранять)
+            history_dir (str): Папка для помесячной динамики (None - режим без динамики)
+        """
+        self.workers = workers
+        self.use_selenium = use_selenium
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.snapshot_dir = snapshot_dir
+        self.history_dir = history_dir
+        
+        self.cache = OrderedDict()  # (запрос, тип) -> (частота, время получения), в порядке обращений
+        self.in_flight = {}   # (запрос, тип) -> Future текущей загрузки
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.idle_workers = 0  # воркеры, ожидающие новый батч
+        self.parsers = []
+        self.threads = []
+        self.stats = {
+            'requests': 0,
+            'cache_hits': 0,
+            'coalesced': 0,
+            'fetches': 0,
+            'batches': 0
+        }
+    
+    def start(self):
+        """Запуск парсеров и потоков-воркеров"""
+        print(f"🚀 Запуск сервиса: {self.workers} воркер(ов)...")
+        
+        for idx in range(self.workers):
+            parser = WordstatParser(
+                use_selenium=self.use_selenium,
+                snapshot_dir=self.snapshot_dir,
+                history_dir=self.history_dir
+            )
+            if parser.use_selenium and parser.driver:
+                parser.authorize_wordstat()
+            self.parsers.append(parser)
+            
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(parser,),
+                name=f"wordstat-worker-{idx + 1}",
+                daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        
+        print("✓ Сервис запущен")
+    
+    def stop(self):
+        """Остановка воркеров и закрытие парсеров"""
+        for _ in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+        for parser in self.parsers:
+            parser.close()
+        self.threads = []
+        self.parsers = []
+    
+    def submit(self, query, query_type="base"):
+        """
+        Постановка запроса в работу
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса ("base", "exact", "precise")
+            
+        Returns:
+            Future: Future с частотой запроса (уже завершенный при попадании в кэш)
+        """
+        key = (query.strip(), query_type)
+        
+        with self.lock:
+            self.stats['requests'] += 1
+            
+            cached = self.cache.get(key)
+            if cached and time.time() - cached[1] < self.cache_ttl:
+                self.stats['cache_hits'] += 1
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(cached[0])
+                return future
+            if cached:
+                # Устаревшую запись удаляем сразу, а не ждем перезагрузки
+                del self.cache[key]
+            
+            # Такой же запрос уже загружается - ждем его результат
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            
+            future = Future()
+            self.in_flight[key] = future
+        
+        self.pending.put((key, future))
+        return future
+    
+    def get_query_frequency(self, query, query_type="base", timeout=None):
+        """
+        Получение частоты запроса через сервис
+        
+        Args:
+            query (str): Исходный запрос
+            query_type (str): Тип запроса
+            timeout (float): Максимальное время ожидания, сек
+            
+        Returns:
+            int or None: Частота запроса
+        """
+        return self.submit(query, query_type).result(timeout=timeout)
+    
+    def _cache_put(self, key, frequency):
+        """Запись в кэш (вызывается под lock) с вытеснением устаревших и давно не запрошенных"""
+        now = time.time()
+        self.cache[key] = (frequency, now)
+        self.cache.move_to_end(key)
+        while self.cache:
+            oldest_key, (_, fetched_at) = next(iter(self.cache.items()))
+            if len(self.cache) <= self.cache_size and now - fetched_at < self.cache_ttl:
+                break
+            del self.cache[oldest_key]
+    
+    def get_stats(self):
+        """
+        Статистика работы сервиса
+        
+        Returns:
+            dict: Счетчики запросов, попаданий в кэш, объединений и загрузок
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['cached'] = len(self.cache)
+            stats['in_flight'] = len(self.in_flight)
+        stats['queued'] = self.pending.qsize()
+        return stats
+    
+    def _next_batch(self):
+        """
+        Сбор микро-батча из очереди ожидающих запросов
+        
+        Воркер берет не больше своей доли очереди, чтобы свободные воркеры
+        не простаивали, пока один загружает весь батч последовательно.
+        
+        Returns:
+            list or None: Список (ключ, Future) или None, если пора остановиться
+        """
+        with self.lock:
+            self.idle_workers += 1
+        item = self.pending.get()
+        with self.lock:
+            self.idle_workers -= 1
+        if item is None:
+            return None
+        
+        batch = [item]
+        deadline = time.time() + self.batch_wait
+        
+        while len(batch) < self.batch_size:
+            with self.lock:
+                idle_workers = self.idle_workers
+            fair_share = math.ceil((len(batch) + self.pending.qsize()) / (idle_workers + 1))
+            if len(batch) >= fair_share:
+                break
+            
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                item = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Сигнал остановки возвращаем в очередь для текущего цикла
+                self.pending.put(None)
+                break
+            batch.append(item)
+        
+        return batch
+    
+    def _worker_loop(self, parser):
+        """
+        Цикл воркера: берет микро-батчи и загружает частоты своим парсером
+        
+        Args:
+            parser (WordstatParser): Прогретый парсер воркера
+        """
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            
+            with self.lock:
+                self.stats['batches'] += 1
+            
+            # Группируем типы одного запроса рядом друг с другом
+            batch.sort(key=lambda item: (item[0][0], QUERY_TYPES.index(item[0][1])))
+            
+            for key, future in batch:
+                query, query_type = key
+                try:
+                    frequency = parser.get_query_frequency(query, query_type)
+                except Exception as e:
+                    with self.lock:
+                        self.in_flight.pop(key, None)
+                    future.set_exception(e)
+                    continue
+                
+                with self.lock:
+                    self.stats['fetches'] += 1
+                    # None не кэшируем, чтобы следующий запрос попробовал снова
+                    if frequency is not None:
+                        self._cache_put(key, frequency)
+                    self.in_flight.pop(key, None)
+                future.set_result(frequency)
+                
+                time.sleep(parser.get_request_delay())
+
+
+class FrequencyRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API сервиса частот
+    
+    GET /frequency?query=...&type=base - частоты запросов; параметр query можно
+    повторять, ответ - всегда список объектов {query, type, frequency}
+    GET /stats - статистика сервиса
+    """
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        
+        if url.path == "/stats":
+            self._send_json(200, self.server.service.get_stats())
+            return
+        
+        if url.path != "/frequency":
+            self._send_json(404, {'error': 'not found'})
+            return
+        
+        queries = [q for q in params.get('query', []) if q.strip()]
+        query_type = params.get('type', ['base'])[0]
+        if not queries:
+            self._send_json(400, {'error': 'parameter "query" is required'})
+            return
+        if query_type not in QUERY_TYPES:
+            self._send_json(400, {'error': f'unknown type "{query_type}"'})
+            return
+        
+        # Сначала ставим все запросы в очередь, чтобы они попали в один микро-батч,
+        # и ждем их с одним общим дедлайном
+        futures = [self.server.service.submit(q, query_type) for q in queries]
+        _, not_done = wait(futures, timeout=self.server.timeout_sec)
+        if not_done:
+            self._send_json(504, {'error': f'timeout after {self.server.timeout_sec} s'})
+            return
+        
+        for future in futures:
+            if future.exception() is not None:
+                self._send_json(500, {'error': str(future.exception())})
+                return
+        
+        results = [
+            {'query': q, 'type': query_type, 'frequency': f.result()}
+            for q, f in zip(queries, futures)
+        ]
+        self._send_json(200, results)
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Не засоряем вывод строкой на каждый HTTP запрос
+        pass
+
+
+def remove_stale_socket(path):
+    """
+    Удаление оставшегося от прошлого запуска Unix-сокета
+    
+    Args:
+        path (str): Путь к сокету
+        
+    Raises:
+        FileExistsError: По пути лежит не сокет (такой файл не удаляется)
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} уже существует и не является сокетом")
+    os.remove(path)
+
+
+# На Windows нет AF_UNIX - там сервис работает только через host/port
+if hasattr(socket, "AF_UNIX"):
+    class UnixHTTPServer(ThreadingHTTPServer):
+        """HTTP сервер на Unix-сокете"""
+        
+        address_family = socket.AF_UNIX
+        
+        def server_bind(self):
+            remove_stale_socket(self.server_address)
+            socketserver.TCPServer.server_bind(self)
+            self.server_name = "localhost"
+            self.server_port = 0
+
+
+def serve(service, host="127.0.0.1", port=8765, unix_socket=None, timeout=120):
+    """
+    Запуск HTTP API сервиса частот (блокирует до Ctrl+C)
+    
+    Args:
+        service (FrequencyService): Запущенный сервис
+        host (str): Адрес для прослушивания
+        port (int): Порт для прослушивания
+        unix_socket (str): Путь к Unix-сокету (вместо host/port)
+        timeout (float): Максимальное время ожидания ответа на запрос, сек
+    """
+    try:
+        if unix_socket:
+            if not hasattr(socket, "AF_UNIX"):
+                print("✗ Unix-сокеты не поддерживаются на этой платформе, используйте --host и --port")
+                return
+            server = UnixHTTPServer(unix_socket, FrequencyRequestHandler)
+            address = unix_socket
+        else:
+            server = ThreadingHTTPServer((host, port), FrequencyRequestHandler)
+            address = f"http://{host}:{port}"
+    except OSError as e:
+        print(f"✗ Не удалось запустить сервис: {e}")
+        return
+    server.daemon_threads = True
+    server.service = service
+    server.timeout_sec = timeout
+    
+    print(f"🌐 Сервис частот слушает {address}")
+    print("   GET /frequency?query=...&type=base|exact|precise, GET /stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⚠️  Остановка сервиса...")
+    finally:
+        server.server_close()
+        if unix_socket:
+            remove_stale_socket(unix_socket)
+
+
+def parse_args():
+    """Разбор аргументов командной строки"""
+    arg_parser = argparse.ArgumentParser(description="Парсер Яндекс Вордстат")
+    arg_parser.add_argument("--serve", action="store_true",
+                            help="запустить долгоживущий сервис частот вместо разовой обработки")
+    arg_parser.add_argument("--host", default="127.0.0.1", help="адрес сервиса (по умолчанию 127.0.0.1)")
+    arg_parser.add_argument("--port", type=int, default=8765, help="порт сервиса (по умолчанию 8765)")
+    arg_parser.add_argument("--socket", help="путь к Unix-сокету вместо host/port")
+    arg_parser.add_argument("--workers", type=int, default=1, help="количество прогретых парсеров сервиса")
+    arg_parser.add_argument("--snapshot-dir",
+                            help="сохранять загруженные страницы в эту папку (снимки для перепарсинга)")
+    arg_parser.add_argument("--history-dir",
+                            help="режим динамики: сохранять помесячную динамику запросов в эту папку")
+    arg_parser.add_argument("--retries", type=int, default=2,
+                            help="количество повторов неудачной загрузки (по умолчанию 2)")
+    arg_parser.add_argument("--attempt-timeout", type=float, default=20,
+                            help="дедлайн одной попытки загрузки, сек (по умолчанию 20)")
+    arg_parser.add_argument("--hedge-workers", type=int, default=0,
+                            help="дополнительные браузеры для хеджирования медленных загрузок")
+    arg_parser.add_argument("--no-inference", action="store_true",
+                            help="загружать все частоты, не выводя нулевые из уже известных")
+    arg_parser.add_argument("--reextract", action="store_true",
+                            help="перепарсить сохраненные снимки офлайн, без сети и браузера")
+    arg_parser.add_argument("--output", default="wordstat_report.xlsx", help="имя выходного Excel файла")
+    return arg_parser.parse_args()
+
+
+def run_service(args):
+    """Запуск долгоживущего сервиса частот"""
+    # Проверяем до запуска браузеров, чтобы не ждать их инициализации зря
+    if args.socket and not hasattr(socket, "AF_UNIX"):
+        print("✗ Unix-сокеты не поддерживаются на этой платформе, используйте --host и --port")
+        return
+    
+    service = FrequencyService(
+        workers=args.workers,
+        snapshot_dir=args.snapshot_dir,
+        history_dir=args.history_dir
+    )
+    service.start()
+    try:
+        serve(service, host=args.host, port=args.port, unix_socket=args.socket)
+    finally:
+        service.stop()
+
+
+def run_reextract(args):
+    """Офлайн-перепарсинг снимков и создание отчета"""
+    results = reextract_snapshots(args.snapshot_dir or "snapshots")
+    if results:
+        WordstatParser(use_selenium=False).create_excel_report(results, args.output)
+        print(f"\n🎉 Готово! Результаты сохранены в {args.output}")
+
+
+def main():
+    """Основная функция программы"""
+    args = parse_args()
+    print("=== Парсер Яндекс Вордстат ===\n")
+    
+    if args.serve:
+        run_service(args)
+        return
+    
+    if args.reextract:
+        run_reextract(args)
+        return
+    
+    # Проверяем наличие файла с запросами
+    input_file = "queries.txt"
+    if not os.path.exists(input_file):
+        print(f"✗ Файл {input_file} не найден!")
+        print(f"Создайте файл {input_file} и добавьте в него запросы (по одному на строку)")
+        return
+    
+    # Создаем экземпляр парсера
+    parser = WordstatParser(
+        use_selenium=True,
+        snapshot_dir=args.snapshot_dir,
+        history_dir=args.history_dir
+    )
+    hedge_parsers = []
+    fetcher = None
+    
+    try:
+        # Читаем запросы из файла
+        queries = parser.read_queries_from_file(input_file)
+        if not queries:
+            print("✗ Не удалось прочитать запросы из файла")
+            return
+        
+        # Дополнительные браузеры для хеджирования медленных загрузок
+        for _ in range(args.hedge_workers):
+            hedge_parser = WordstatParser(
+                use_selenium=True,
+                snapshot_dir=args.snapshot_dir,
+                history_dir=args.history_dir
+            )
+            if hedge_parser.use_selenium and hedge_parser.driver:
+                hedge_parser.authorize_wordstat()
+            hedge_parsers.append(hedge_parser)
+        
+        fetcher = HedgedFetcher(
+            [parser] + hedge_parsers,
+            attempt_timeout=args.attempt_timeout,
+            max_retries=args.retries
+        )
         
         # Обрабатываем запросы
-        results = parser.process_queries(queries)
+        inference = None if args.no_inference else FrequencyInference()
+        results = parser.process_queries(queries, fetcher=fetcher, inference=inference)
         
         # Создаем Excel отчет
-        output_file = "wordstat_report.xlsx"
+        output_file = args.output
         parser.create_excel_report(results, output_file)
         
         print(f"\n🎉 Готово! Результаты сохранены в {output_file}")
@@ -749,6 +2109,10 @@ def main():
     except Exception as e:
         print(f"\n✗ Произошла ошибка: {e}")
     finally:
+        if fetcher:
+            fetcher.close()
+        for hedge_parser in hedge_parsers:
+            hedge_parser.close()
         parser.close()
 
 